@@ -66,15 +66,19 @@ class Environment(models.Model):
         super(Environment, self).save(*args, **kwargs)
 
         if requires_feature_state_creation:
-            # also create feature states for all features in the project
-            features = self.project.features.all()
-            for feature in features:
-                FeatureState.objects.create(
-                    feature=feature,
-                    environment=self,
-                    identity=None,
-                    enabled=feature.default_enabled,
-                )
+            # also create feature states for all features in the project. Note that
+            # the features are retrieved again with all their fields when the values
+            # are created so only load what is needed to create the states here.
+            FeatureState.bulk_create_environment_defaults(
+                [
+                    FeatureState(
+                        feature=feature,
+                        environment=self,
+                        enabled=feature.default_enabled,
+                    )
+                    for feature in self.project.features.only("id", "default_enabled")
+                ]
+            )
 
     def __str__(self):
         return "Project %s - Environment %s" % (self.project.name, self.name)
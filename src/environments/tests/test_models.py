@@ -1,6 +1,7 @@
 from unittest import mock
 
 import pytest
+from django.db import connection
 from django.test import TestCase
 
 from environments.identities.models import Identity
@@ -55,6 +56,53 @@ class EnvironmentTestCase(TestCase):
         self.environment.save()
         self.assertFalse(FeatureState.objects.get().enabled)
 
+    def test_on_creation_save_feature_states_are_created_with_values_and_history(
+        self,
+    ):
+        # Given
+        Feature.objects.create(
+            name="Test Feature 2", project=self.project, initial_value="value"
+        )
+
+        # When
+        self.environment.save()
+
+        # Then
+        feature_state = FeatureState.objects.get(
+            environment=self.environment, feature__name="Test Feature 2"
+        )
+        assert feature_state.get_feature_state_value() == "value"
+        assert feature_state.history.count() == 1
+        assert feature_state.feature_state_value.history.count() == 1
+
+    def test_on_creation_save_feature_states_are_created_when_db_cannot_return_ids_from_bulk_insert(  # noqa: E501
+        self,
+    ):
+        # Given
+        Feature.objects.create(
+            name="Test Feature 2", project=self.project, initial_value="value"
+        )
+
+        # When
+        # simulate a db other than postgres, where bulk_create doesn't set primary keys
+        with mock.patch.object(
+            connection.features, "can_return_ids_from_bulk_insert", False
+        ), mock.patch.object(
+            type(connection.features), "supports_ignore_conflicts", False
+        ):
+            self.environment.save()
+
+        # Then
+        feature_states = FeatureState.objects.filter(environment=self.environment)
+        assert feature_states.count() == 2
+        for feature_state in feature_states:
+            assert feature_state.history.count() == 1
+            assert feature_state.feature_state_value.history.count() == 1
+        assert (
+            feature_states.get(feature__name="Test Feature 2").get_feature_state_value()
+            == "value"
+        )
+
     @mock.patch("environments.models.environment_cache")
     def test_get_from_cache_stores_environment_in_cache_on_success(self, mock_cache):
         # Given
@@ -65,7 +65,7 @@ class FeatureStateAdmin(SimpleHistoryAdmin):
         "feature",
     )
     list_select_related = (
-        "environment",
+        "environment__project",
         "feature",
         "identity",
     )
@@ -90,7 +90,11 @@ class FeatureStateValueAdmin(SimpleHistoryAdmin):
         "type",
         "boolean_value",
     )
-    list_select_related = ("feature_state",)
+    list_select_related = (
+        "feature_state__environment__project",
+        "feature_state__feature",
+        "feature_state__identity",
+    )
     raw_id_fields = ("feature_state",)
     search_fields = (
         "string_value",
@@ -0,0 +1,11 @@
+from django.db import models
+
+
+class FeatureStateManager(models.Manager):
+    def with_display(self):
+        """
+        Return a queryset with the related objects needed by FeatureState.__str__
+        already loaded. Use this for any code which logs or prints many feature
+        states to avoid querying the db for each one.
+        """
+        return self.select_related("environment__project", "feature", "identity")
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.17 on 2026-10-14 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('features', '0030_auto_20210401_1552'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='featurestate',
+            index=models.Index(fields=['feature', 'environment'], name='fs_feature_environment_idx'),
+        ),
+    ]
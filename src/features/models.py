@@ -1,20 +1,23 @@
 from __future__ import unicode_literals
 
 import logging
+from functools import partial
 
 from django.core.exceptions import (
     NON_FIELD_ERRORS,
     ObjectDoesNotExist,
     ValidationError,
 )
-from django.db import models
-from django.db.models import Q, UniqueConstraint
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Index, Max, Q, UniqueConstraint, Value
+from django.db.models.functions import Lower
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from ordered_model.models import OrderedModelBase
 from simple_history.models import HistoricalRecords
 
 from features.helpers import get_correctly_typed_value
+from features.managers import FeatureStateManager
 from features.tasks import trigger_feature_state_change_webhooks
 from features.utils import (
     get_boolean_from_string,
@@ -38,6 +41,17 @@ FEATURE_STATE_VALUE_TYPES = (
     (BOOLEAN, "Boolean"),
 )
 
+# the field on FeatureStateValue used to store a value of each type
+FEATURE_STATE_VALUE_KEY_NAMES = {
+    INTEGER: "integer_value",
+    BOOLEAN: "boolean_value",
+    STRING: "string_value",
+}
+
+# the maximum number of objects to insert in a single query when creating the
+# default feature states (and their values) for multiple features or environments
+FEATURE_STATE_BULK_CREATE_BATCH_SIZE = 500
+
 
 @python_2_unicode_compatible
 class Feature(models.Model):
@@ -70,31 +84,51 @@ class Feature(models.Model):
         """
         Override save method to initialise feature states for all environments
         """
-        feature_state_defaults = {}
+        project_environment_ids = list(
+            self.project.environments.values_list("id", flat=True)
+        )
+        # map of environment id to the id of the environment default feature state
+        existing_environment_defaults = {}
+
         if self.pk:
-            # If the feature has moved to a new project, delete the feature states from the old project
-            old_feature = Feature.objects.get(pk=self.pk)
-            if old_feature.project != self.project:
+            old_project_id = (
+                Feature.objects.filter(pk=self.pk)
+                .values_list("project_id", flat=True)
+                .first()
+            )
+            if old_project_id != self.project_id:
+                # If the feature has moved to a new project, delete the feature states from the old project
                 FeatureState.objects.filter(
-                    feature=self,
-                    environment__in=old_feature.project.environments.all(),
+                    feature=self, environment__project_id=old_project_id
                 ).delete()
-        else:
-            feature_state_defaults["enabled"] = self.default_enabled
+
+            existing_environment_defaults = dict(
+                FeatureState.objects.filter(
+                    feature=self,
+                    identity__isnull=True,
+                    feature_segment__isnull=True,
+                ).values_list("environment_id", "id")
+            )
 
         super(Feature, self).save(*args, **kwargs)
 
-        # create / update feature states for all environments in the project
-        # todo: is update necessary here
-        environments = self.project.environments.all()
-        for env in environments:
-            FeatureState.objects.update_or_create(
-                feature=self,
-                environment=env,
-                identity=None,
-                feature_segment=None,
-                defaults=feature_state_defaults,
-            )
+        # create feature states for any environments in the project that don't have one yet
+        environment_ids = [
+            environment_id
+            for environment_id in project_environment_ids
+            if environment_id not in existing_environment_defaults
+        ]
+        FeatureState.bulk_create_environment_defaults(
+            [
+                FeatureState(
+                    feature=self,
+                    environment_id=environment_id,
+                    enabled=self.default_enabled,
+                )
+                for environment_id in environment_ids
+            ],
+            existing_ids=set(existing_environment_defaults.values()),
+        )
 
     def validate_unique(self, *args, **kwargs):
         """
@@ -105,7 +139,7 @@ class Feature(models.Model):
 
         # handle case insensitive names per project, as above check allows it
         if (
-            Feature.objects.filter(project=self.project, name__iexact=self.name)
+            Feature.filter_by_case_insensitive_name(self.project, self.name)
             .exclude(pk=self.pk)
             .exists()
         ):
@@ -118,18 +152,28 @@ class Feature(models.Model):
                 }
             )
 
+    @classmethod
+    def filter_by_case_insensitive_name(cls, project, name):
+        """
+        Get the features in the project with the given name, ignoring case. Note that
+        this filters on lower(name) rather than using iexact so that the
+        lowercase_feature_name index can be used, and lowercases the name in the db
+        too so that it matches the index for any name.
+        """
+        return cls.objects.annotate(lower_name=Lower("name")).filter(
+            project=project,
+            lower_name=Lower(Value(name, output_field=models.CharField())),
+        )
+
     def __str__(self):
         return "Project %s - Feature %s" % (self.project.name, self.name)
 
 
 def get_next_segment_priority(feature):
-    feature_segments = FeatureSegment.objects.filter(feature=feature).order_by(
-        "-priority"
-    )
-    if feature_segments.count() == 0:
-        return 1
-    else:
-        return feature_segments.first().priority + 1
+    max_priority = FeatureSegment.objects.filter(feature=feature).aggregate(
+        max_priority=Max("priority")
+    )["max_priority"]
+    return (max_priority or 0) + 1
 
 
 @python_2_unicode_compatible
@@ -230,6 +274,8 @@ class FeatureState(models.Model):
     enabled = models.BooleanField(default=False)
     history = HistoricalRecords()
 
+    objects = FeatureStateManager()
+
     class Meta:
         # Note: this is manually overridden in the migrations for Oracle DBs to include
         # all 4 unique fields in each of these constraints. See migration 0025.
@@ -250,6 +296,11 @@ class FeatureState(models.Model):
                 name="unique_for_environment",
             ),
         ]
+        # the unique constraints above are conditional so add an unconditional index
+        # for the queries which filter on feature and environment
+        indexes = [
+            Index(fields=["feature", "environment"], name="fs_feature_environment_idx")
+        ]
         ordering = ["id"]
 
     def __gt__(self, other):
@@ -259,46 +310,126 @@ class FeatureState(models.Model):
         :param other: (FeatureState) the feature state to compare the priority of
         :return: True if self is higher priority than other
         """
-        if self.environment != other.environment:
+        if self.environment_id != other.environment_id:
             raise ValueError(
                 "Cannot compare feature states as they belong to different environments."
             )
 
-        if self.feature != other.feature:
+        if self.feature_id != other.feature_id:
             raise ValueError(
                 "Cannot compare feature states as they belong to different features."
             )
 
-        if self.identity:
+        if self.identity_id:
             # identity is the highest priority so we can always return true
-            if other.identity and self.identity != other.identity:
+            if other.identity_id and self.identity_id != other.identity_id:
                 raise ValueError(
                     "Cannot compare feature states as they are for different identities."
                 )
             return True
 
-        if self.feature_segment:
+        if self.feature_segment_id:
             # Return true if other_feature_state has a lower priority feature segment and not an identity overridden
             # flag, else False.
-            return not (other.identity or self.feature_segment < other.feature_segment)
+            return not (
+                other.identity_id
+                or (
+                    other.feature_segment_id
+                    and self.feature_segment < other.feature_segment
+                )
+            )
 
         # if we've reached here, then self is just the environment default. In this case, other is higher priority if
         # it has a feature_segment or an identity
-        return not (other.feature_segment or other.identity)
+        return not (other.feature_segment_id or other.identity_id)
+
+    @classmethod
+    def bulk_create_environment_defaults(cls, feature_states, existing_ids=None):
+        """
+        Create environment default feature states in bulk rather than saving each one
+        individually. Since this bypasses FeatureState.save, the side effects of that
+        method (creating the feature state values and triggering the webhooks) are
+        replicated here, along with the history that simple_history would record.
+
+        Any feature states which already exist (e.g. because they were created by a
+        concurrent request after existing_ids was read) are skipped. Values are only
+        created for the new feature states which don't have one, so that a value
+        created for a feature state by a concurrent FeatureState.save isn't
+        duplicated.
+
+        :param feature_states: unsaved FeatureState objects without an identity or
+            feature segment
+        :param existing_ids: ids of any environment default feature states which
+            already exist for the given features and environments, these are
+            retrieved if not given
+        """
+        if not feature_states:
+            return
+
+        new_feature_state_keys = {
+            (fs.feature_id, fs.environment_id) for fs in feature_states
+        }
+        environment_defaults = cls.objects.filter(
+            feature_id__in={feature_id for feature_id, _ in new_feature_state_keys},
+            environment_id__in={
+                environment_id for _, environment_id in new_feature_state_keys
+            },
+            identity__isnull=True,
+            feature_segment__isnull=True,
+        )
+        if existing_ids is None:
+            existing_ids = set(environment_defaults.values_list("id", flat=True))
+
+        cls.objects.bulk_create(
+            feature_states,
+            batch_size=FEATURE_STATE_BULK_CREATE_BATCH_SIZE,
+            ignore_conflicts=connection.features.supports_ignore_conflicts,
+        )
+
+        # primary keys aren't set by bulk_create when ignoring conflicts (or on any db
+        # other than postgres) so we need to retrieve the new feature states again
+        feature_states = [
+            feature_state
+            for feature_state in environment_defaults.select_related("feature")
+            .exclude(id__in=existing_ids)
+            .filter(feature_state_value__isnull=True)
+            if (feature_state.feature_id, feature_state.environment_id)
+            in new_feature_state_keys
+        ]
+        feature_state_values = FeatureStateValue.objects.bulk_create(
+            [
+                FeatureStateValue(
+                    feature_state=feature_state,
+                    **(feature_state._get_feature_state_defaults() or {}),
+                )
+                for feature_state in feature_states
+            ],
+            batch_size=FEATURE_STATE_BULK_CREATE_BATCH_SIZE,
+        )
+        if not connection.features.can_return_ids_from_bulk_insert:
+            feature_state_values = list(
+                FeatureStateValue.objects.filter(feature_state__in=feature_states)
+            )
+
+        cls.history.bulk_history_create(
+            feature_states, batch_size=FEATURE_STATE_BULK_CREATE_BATCH_SIZE
+        )
+        FeatureStateValue.history.bulk_history_create(
+            feature_state_values, batch_size=FEATURE_STATE_BULK_CREATE_BATCH_SIZE
+        )
+
+        for feature_state in feature_states:
+            transaction.on_commit(
+                partial(trigger_feature_state_change_webhooks, feature_state)
+            )
 
     def get_feature_state_value(self):
         try:
-            value_type = self.feature_state_value.type
+            feature_state_value = self.feature_state_value
         except ObjectDoesNotExist:
             return None
 
-        type_mapping = {
-            INTEGER: self.feature_state_value.integer_value,
-            STRING: self.feature_state_value.string_value,
-            BOOLEAN: self.feature_state_value.boolean_value,
-        }
-
-        return type_mapping.get(value_type)
+        return _get_typed_value(feature_state_value)
 
     @property
     def previous_feature_state_value(self):
@@ -310,30 +441,28 @@ class FeatureState(models.Model):
         previous_feature_state_value = getattr(history_instance, "prev_record", None)
 
         if previous_feature_state_value:
-            value_type = previous_feature_state_value.type
-
-            type_mapping = {
-                INTEGER: previous_feature_state_value.integer_value,
-                STRING: previous_feature_state_value.string_value,
-                BOOLEAN: previous_feature_state_value.boolean_value,
-            }
-
-            return type_mapping.get(value_type)
+            return _get_typed_value(previous_feature_state_value)
 
     def save(self, *args, **kwargs):
-        # prevent duplicate feature states being created for an environment
-        if (
-            not self.pk
-            and FeatureState.objects.filter(
-                environment=self.environment, feature=self.feature
-            ).exists()
-            and not (self.identity or self.feature_segment)
-        ):
-            raise ValidationError(
-                "Feature state already exists for this environment and feature"
-            )
-
-        super(FeatureState, self).save(*args, **kwargs)
+        if not (self.pk or self.identity_id or self.feature_segment_id):
+            # prevent duplicate feature states being created for an environment. This
+            # is enforced by the unique_for_environment constraint, the savepoint
+            # ensures that any outer transaction is still usable if it fails (there's
+            # nothing to roll back to outside of a transaction so it's not needed).
+            try:
+                if connection.in_atomic_block:
+                    with transaction.atomic():
+                        super(FeatureState, self).save(*args, **kwargs)
+                else:
+                    super(FeatureState, self).save(*args, **kwargs)
+            except IntegrityError as e:
+                if not self._environment_default_exists():
+                    raise
+                raise ValidationError(
+                    "Feature state already exists for this environment and feature"
+                ) from e
+        else:
+            super(FeatureState, self).save(*args, **kwargs)
 
         # create default feature state value for feature state
         # note: this is get_or_create since feature state values are updated separately,
@@ -342,8 +471,18 @@ class FeatureState(models.Model):
         FeatureStateValue.objects.get_or_create(
             feature_state=self, defaults=self._get_feature_state_defaults()
         )
+        # only trigger the webhooks once the change has been committed so that they
+        # aren't sent for changes which are rolled back
         # TODO: move this to an async call using celery or django-rq
-        trigger_feature_state_change_webhooks(self)
+        transaction.on_commit(partial(trigger_feature_state_change_webhooks, self))
+
+    def _environment_default_exists(self):
+        return FeatureState.objects.filter(
+            feature_id=self.feature_id,
+            environment_id=self.environment_id,
+            identity__isnull=True,
+            feature_segment__isnull=True,
+        ).exists()
 
     def _get_feature_state_defaults(self):
         if not (self.feature.initial_value or self.feature.initial_value is False):
@@ -365,11 +504,7 @@ class FeatureState(models.Model):
 
     @staticmethod
     def get_feature_state_key_name(fsv_type):
-        return {
-            INTEGER: "integer_value",
-            BOOLEAN: "boolean_value",
-            STRING: "string_value",
-        }.get(
+        return FEATURE_STATE_VALUE_KEY_NAMES.get(
             fsv_type, "string_value"
         )  # The default was chosen for backwards compatibility
 
@@ -392,14 +527,14 @@ class FeatureState(models.Model):
         }
 
     def __str__(self):
-        if self.environment is not None:
+        if self.environment_id is not None:
             return "Project %s - Environment %s - Feature %s - Enabled: %r" % (
                 self.environment.project.name,
                 self.environment.name,
                 self.feature.name,
                 self.enabled,
             )
-        elif self.identity is not None:
+        elif self.identity_id is not None:
             return "Identity %s - Feature %s - Enabled: %r" % (
                 self.identity.identifier,
                 self.feature.name,
@@ -409,6 +544,15 @@ class FeatureState(models.Model):
             return "Feature %s - Enabled: %r" % (self.feature.name, self.enabled)
 
 
+def _get_typed_value(feature_state_value):
+    """
+    Get the value stored on a feature state value (or a historical record of one)
+    from the field matching its type.
+    """
+    key_name = FEATURE_STATE_VALUE_KEY_NAMES.get(feature_state_value.type)
+    return getattr(feature_state_value, key_name) if key_name else None
+
+
 class FeatureStateValue(models.Model):
     feature_state = models.OneToOneField(
         FeatureState, related_name="feature_state_value", on_delete=models.CASCADE
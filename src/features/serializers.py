@@ -1,3 +1,4 @@
+from django.db import IntegrityError, transaction
 from drf_writable_nested import NestedCreateMixin, NestedUpdateMixin
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
@@ -27,17 +28,23 @@ class CreateFeatureSerializer(serializers.ModelSerializer):
         return super(CreateFeatureSerializer, self).to_internal_value(data)
 
     def create(self, validated_data):
-        if Feature.objects.filter(
-            project=validated_data["project"], name__iexact=validated_data["name"]
-        ).exists():
+        # case insensitive uniqueness of feature names is enforced by the
+        # lowercase_feature_name unique index so we rely on that here rather than
+        # querying for an existing feature first
+        try:
+            with transaction.atomic():
+                instance = super(CreateFeatureSerializer, self).create(validated_data)
+        except IntegrityError:
+            if not Feature.filter_by_case_insensitive_name(
+                validated_data["project"], validated_data["name"]
+            ).exists():
+                raise
             raise serializers.ValidationError(
                 "Feature with that name already exists for this "
                 "project. Note that feature names are case "
                 "insensitive."
             )
 
-        instance = super(CreateFeatureSerializer, self).create(validated_data)
-
         self._create_audit_log(instance, True)
 
         return instance
@@ -72,7 +79,7 @@ class CreateFeatureSerializer(serializers.ModelSerializer):
 
 
 class UpdateFeatureSerializer(CreateFeatureSerializer):
-    """ prevent users from changing the value of default enabled after creation """
+    """prevent users from changing the value of default enabled after creation"""
 
     class Meta(CreateFeatureSerializer.Meta):
         read_only_fields = CreateFeatureSerializer.Meta.read_only_fields + (
@@ -29,7 +29,7 @@ def trigger_feature_state_change_webhooks(instance):
         "timestamp": timestamp,
     }
 
-    if history_instance.prev_record:
+    if history_instance and history_instance.prev_record:
         data["previous_state"] = _get_feature_state_webhook_data(
             history_instance.prev_record.instance, previous=True
         )
@@ -2,6 +2,7 @@ from unittest import mock
 
 import pytest
 from django.core.exceptions import ValidationError
+from django.db import connection, models
 from django.db.utils import IntegrityError
 from django.test import TestCase
 
@@ -11,6 +12,8 @@ from features.models import (
     Feature,
     FeatureSegment,
     FeatureState,
+    FeatureStateValue,
+    get_next_segment_priority,
 )
 from organisations.models import Organisation
 from projects.models import Project
@@ -107,6 +110,110 @@ class FeatureTestCase(TestCase):
         for feature_state in feature_states:
             assert feature_state.get_feature_state_value() == initial_value
 
+    def test_creating_feature_should_create_feature_states_with_values_and_history(
+        self,
+    ):
+        # When
+        feature = Feature.objects.create(
+            name="Test Feature",
+            project=self.project,
+            default_enabled=True,
+            initial_value="value",
+        )
+
+        # Then
+        feature_states = FeatureState.objects.filter(feature=feature)
+        assert {fs.environment_id for fs in feature_states} == {
+            self.environment_one.id,
+            self.environment_two.id,
+        }
+        for feature_state in feature_states:
+            assert feature_state.enabled
+            assert feature_state.get_feature_state_value() == "value"
+            assert feature_state.history.filter(history_type="+").count() == 1
+            assert feature_state.feature_state_value.history.count() == 1
+
+    def test_creating_feature_when_db_cannot_return_ids_from_bulk_insert(self):
+        # Given
+        # simulate a db other than postgres, where bulk_create doesn't set primary keys
+        with mock.patch.object(
+            connection.features, "can_return_ids_from_bulk_insert", False
+        ), mock.patch.object(
+            type(connection.features), "supports_ignore_conflicts", False
+        ):
+            # When
+            feature = Feature.objects.create(
+                name="Test Feature", project=self.project, initial_value="value"
+            )
+
+        # Then
+        feature_states = FeatureState.objects.filter(feature=feature)
+        assert feature_states.count() == 2
+        for feature_state in feature_states:
+            assert feature_state.get_feature_state_value() == "value"
+            assert feature_state.history.count() == 1
+            assert feature_state.feature_state_value.history.count() == 1
+
+    def test_saving_feature_only_creates_history_for_new_feature_states(self):
+        # Given
+        feature = Feature.objects.create(name="Test Feature", project=self.project)
+        # an existing feature state without a value, which shouldn't be treated as new
+        existing_feature_state = FeatureState.objects.get(
+            feature=feature, environment=self.environment_one
+        )
+        existing_feature_state.feature_state_value.delete()
+        # and an environment which is missing its feature state
+        FeatureState.objects.filter(
+            feature=feature, environment=self.environment_two
+        ).delete()
+
+        # When
+        feature.save()
+
+        # Then
+        assert existing_feature_state.history.filter(history_type="+").count() == 1
+        assert not FeatureStateValue.objects.filter(
+            feature_state=existing_feature_state
+        ).exists()
+        new_feature_state = FeatureState.objects.get(
+            feature=feature, environment=self.environment_two
+        )
+        assert new_feature_state.history.filter(history_type="+").count() == 1
+        assert new_feature_state.feature_state_value.history.count() == 1
+
+    def test_bulk_create_environment_defaults_skips_feature_states_created_concurrently(
+        self,
+    ):
+        # Given
+        feature = Feature.objects.create(
+            name="Test Feature", project=self.project, initial_value="value"
+        )
+        # an environment default which was created after the existing ids were read
+        concurrent_feature_state = FeatureState.objects.get(
+            feature=feature, environment=self.environment_one
+        )
+
+        # When
+        FeatureState.bulk_create_environment_defaults(
+            [FeatureState(feature=feature, environment=self.environment_one)],
+            existing_ids=set(),
+        )
+
+        # Then
+        assert (
+            FeatureState.objects.filter(
+                feature=feature, environment=self.environment_one
+            ).get()
+            == concurrent_feature_state
+        )
+        assert concurrent_feature_state.history.count() == 1
+        assert (
+            FeatureStateValue.objects.filter(
+                feature_state=concurrent_feature_state
+            ).count()
+            == 1
+        )
+
     def test_updating_feature_state_should_trigger_webhook(self):
         feature = Feature.objects.create(name="Test Feature", project=self.project)
         # TODO: implement webhook test method
@@ -169,6 +276,15 @@ class FeatureTestCase(TestCase):
         feature.name = feature_name.lower()
         feature.full_clean()  # should not raise error as the same Object
 
+    def test_cannot_create_feature_with_same_non_ascii_name(self):
+        # Given
+        # lowercasing these names in python gives a different result to the db
+        Feature.objects.create(name="İstanbul", project=self.project)
+
+        # When
+        with self.assertRaises(ValidationError):
+            Feature(name="İSTANBUL", project=self.project).validate_unique()
+
     def test_when_create_feature_with_tags_then_success(self):
 
         # Given
@@ -194,6 +310,72 @@ class FeatureTestCase(TestCase):
         self.assertEqual(feature.tags.count(), 2)
         self.assertEqual(list(feature.tags.all()), [tag1, tag2])
 
+    def test_moving_feature_to_another_project_replaces_its_feature_states(self):
+        # Given
+        feature = Feature.objects.create(name="Test Feature", project=self.project)
+        other_project = Project.objects.create(
+            name="Other Project", organisation=self.organisation
+        )
+        other_environment = Environment.objects.create(
+            name="Other Environment", project=other_project
+        )
+
+        # When
+        feature.project = other_project
+        feature.save()
+
+        # Then
+        assert list(
+            FeatureState.objects.filter(feature=feature).values_list(
+                "environment_id", flat=True
+            )
+        ) == [other_environment.id]
+
+    def test_moving_feature_to_another_project_keeps_feature_states_without_environment(
+        self,
+    ):
+        # Given
+        feature = Feature.objects.create(name="Test Feature", project=self.project)
+        FeatureState.objects.bulk_create(
+            [FeatureState(feature=feature, environment=None)]
+        )
+        feature_state_without_environment = FeatureState.objects.get(
+            feature=feature, environment__isnull=True
+        )
+        other_project = Project.objects.create(
+            name="Other Project", organisation=self.organisation
+        )
+
+        # When
+        feature.project = other_project
+        feature.save()
+
+        # Then
+        assert list(FeatureState.objects.filter(feature=feature)) == [
+            feature_state_without_environment
+        ]
+
+    def test_get_next_segment_priority_returns_1_if_no_feature_segments(self):
+        # Given
+        feature = Feature.objects.create(name="Test Feature", project=self.project)
+
+        # Then
+        assert get_next_segment_priority(feature) == 1
+
+    def test_get_next_segment_priority_returns_one_more_than_highest_priority(self):
+        # Given
+        feature = Feature.objects.create(name="Test Feature", project=self.project)
+        segment = Segment.objects.create(name="Test Segment", project=self.project)
+        FeatureSegment.objects.create(
+            feature=feature,
+            segment=segment,
+            environment=self.environment_one,
+            priority=3,
+        )
+
+        # Then
+        assert get_next_segment_priority(feature) == 4
+
 
 @pytest.mark.django_db
 class FeatureStateTest(TestCase):
@@ -232,6 +414,26 @@ class FeatureStateTest(TestCase):
             == 1
         )
 
+    def test_save_does_not_hide_integrity_errors_unrelated_to_duplicates(self):
+        # Given
+        FeatureState.objects.filter(
+            feature=self.feature, environment=self.environment
+        ).delete()
+        feature_state = FeatureState(
+            feature=self.feature, environment=self.environment, enabled=True
+        )
+
+        # When
+        with mock.patch.object(
+            models.Model, "save", side_effect=IntegrityError
+        ), pytest.raises(IntegrityError):
+            feature_state.save()
+
+        # Then
+        assert not FeatureState.objects.filter(
+            feature=self.feature, environment=self.environment
+        ).exists()
+
     def test_feature_state_gt_operator(self):
         # Given
         identity = Identity.objects.create(
@@ -284,6 +486,26 @@ class FeatureStateTest(TestCase):
         # and feature state with any segment is greater than default environment state
         assert segment_2_state > default_env_state
 
+    def test_feature_state_gt_operator_does_not_fetch_related_objects(self):
+        # Given
+        identity = Identity.objects.create(
+            identifier="test_identity", environment=self.environment
+        )
+        identity_override = FeatureState.objects.create(
+            feature=self.feature, environment=self.environment, identity=identity
+        )
+        identity_override = FeatureState.objects.get(pk=identity_override.pk)
+        environment_default = FeatureState.objects.get(
+            feature=self.feature, environment=self.environment, identity=None
+        )
+
+        # When
+        with self.assertNumQueries(0):
+            result = identity_override > environment_default
+
+        # Then
+        assert result
+
     def test_feature_state_gt_operator_throws_value_error_if_different_environments(
         self,
     ):
@@ -342,8 +564,11 @@ class FeatureStateTest(TestCase):
 
         # Then - exception raised
 
+    @mock.patch("features.models.transaction")
     @mock.patch("features.models.trigger_feature_state_change_webhooks")
-    def test_save_calls_trigger_webhooks(self, mock_trigger_webhooks):
+    def test_save_calls_trigger_webhooks_on_commit(
+        self, mock_trigger_webhooks, mock_transaction
+    ):
         # Given
         feature_state = FeatureState.objects.get(
             feature=self.feature, environment=self.environment
@@ -353,4 +578,25 @@ class FeatureStateTest(TestCase):
         feature_state.save()
 
         # Then
+        # the webhooks are not triggered until the transaction is committed
+        mock_trigger_webhooks.assert_not_called()
+
+        on_commit_callback = mock_transaction.on_commit.call_args[0][0]
+        on_commit_callback()
         mock_trigger_webhooks.assert_called_with(feature_state)
+
+    def test_with_display_loads_related_objects_required_for_str(self):
+        # Given
+        Feature.objects.create(name="Test feature 2", project=self.project)
+
+        # When
+        with self.assertNumQueries(1):
+            feature_state_strings = [
+                str(feature_state)
+                for feature_state in FeatureState.objects.with_display().filter(
+                    environment=self.environment
+                )
+            ]
+
+        # Then
+        assert len(feature_state_strings) == 2
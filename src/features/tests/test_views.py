@@ -4,7 +4,9 @@ from unittest import TestCase, mock
 
 import pytest
 import pytz
+from django.db import IntegrityError, connection
 from django.forms import model_to_dict
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
@@ -182,6 +184,39 @@ class ProjectFeatureTestCase(TestCase):
         ).first()
         assert feature_state.get_feature_state_value() == default_value
 
+    def test_cannot_create_feature_with_same_case_insensitive_name(self):
+        # Given
+        Feature.objects.create(name="Test Feature", project=self.project)
+        data = {"name": "test feature", "project": self.project.id}
+        url = reverse("api-v1:projects:project-features-list", args=[self.project.id])
+
+        # When
+        response = self.client.post(
+            url, data=json.dumps(data), content_type="application/json"
+        )
+
+        # Then
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert Feature.objects.filter(project=self.project).count() == 1
+
+    @mock.patch("features.models.FeatureState.bulk_create_environment_defaults")
+    def test_create_feature_does_not_hide_integrity_errors_unrelated_to_the_name(
+        self, mock_bulk_create_environment_defaults
+    ):
+        # Given
+        mock_bulk_create_environment_defaults.side_effect = IntegrityError
+        data = {"name": "test feature", "project": self.project.id}
+        url = reverse("api-v1:projects:project-features-list", args=[self.project.id])
+
+        # When
+        with pytest.raises(IntegrityError):
+            self.client.post(
+                url, data=json.dumps(data), content_type="application/json"
+            )
+
+        # Then
+        assert not Feature.objects.filter(project=self.project).exists()
+
     def test_should_delete_feature_states_when_feature_deleted(self):
         # Given
         feature = Feature.objects.create(name="test feature", project=self.project)
@@ -621,6 +656,39 @@ class FeatureStateViewSetTestCase(TestCase):
         # and
         assert res.json()["results"][0]["identity"]["identifier"] == identifier
 
+    def test_list_feature_states_does_not_query_per_feature_state(self):
+        # Given
+        url = (
+            reverse(
+                "api-v1:environments:environment-featurestates-list",
+                args=[self.environment.api_key],
+            )
+            + "?anyIdentity"
+        )
+
+        def create_identity_override(identifier):
+            identity = Identity.objects.create(
+                identifier=identifier, environment=self.environment
+            )
+            FeatureState.objects.create(
+                environment=self.environment, feature=self.feature, identity=identity
+            )
+
+        create_identity_override("identity-1")
+        with CaptureQueriesContext(connection) as single_override_queries:
+            self.client.get(url)
+
+        create_identity_override("identity-2")
+        create_identity_override("identity-3")
+
+        # When
+        with CaptureQueriesContext(connection) as multiple_override_queries:
+            res = self.client.get(url)
+
+        # Then
+        assert len(res.json()["results"]) == 3
+        assert len(multiple_override_queries) == len(single_override_queries)
+
 
 @pytest.mark.django_db
 class SDKFeatureStatesTestCase(APITestCase):
@@ -144,9 +144,9 @@ class FeatureStateViewSet(viewsets.ModelViewSet):
             api_key=environment_api_key,
         )
 
-        queryset = FeatureState.objects.filter(
-            environment=environment, feature_segment=None
-        )
+        queryset = FeatureState.objects.select_related(
+            "feature_state_value", "identity"
+        ).filter(environment=environment, feature_segment=None)
 
         if identity_pk:
             queryset = queryset.filter(identity__pk=identity_pk)
@@ -374,7 +374,9 @@ class SDKFeatureStates(GenericAPIView):
         if "feature" in request.GET:
             filter_args["feature__name__iexact"] = request.GET["feature"]
             try:
-                feature_state = FeatureState.objects.get(**filter_args)
+                feature_state = FeatureState.objects.select_related(
+                    "feature", "feature_state_value"
+                ).get(**filter_args)
             except FeatureState.DoesNotExist:
                 return Response(
                     {"detail": "Given feature not found"},
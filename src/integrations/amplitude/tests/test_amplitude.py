@@ -1,3 +1,5 @@
+from unittest import mock
+
 import pytest
 
 from environments.models import Environment
@@ -58,3 +60,19 @@ def test_amplitude_when_generate_user_data_with_correct_values_then_success():
     }
 
     assert expected_user_data == user_data
+
+
+@mock.patch.object(AmplitudeWrapper, "_identify_user")
+def test_amplitude_identify_users_identifies_each_user(mock_identify_user):
+    # Given
+    amplitude_wrapper = AmplitudeWrapper(api_key="123key")
+    users_data = [{"user_id": "user1"}, {"user_id": "user2"}]
+
+    # When
+    amplitude_wrapper._identify_users(users_data)
+
+    # Then
+    assert mock_identify_user.call_args_list == [
+        mock.call(users_data[0]),
+        mock.call(users_data[1]),
+    ]
@@ -1,3 +1,4 @@
+import typing
 from abc import ABC, abstractmethod, abstractstaticmethod
 
 from util.util import postpone
@@ -22,10 +23,31 @@ class AbstractBaseIdentityIntegrationWrapper(ABC):
     def _identify_user(self, user_data: dict) -> None:
         raise NotImplementedError
 
+    def _identify_users(self, users_data: typing.List[dict]) -> None:
+        """
+        Integrations which can identify multiple users in a single request should
+        override this to do so.
+        """
+        for user_data in users_data:
+            self._identify_user(user_data)
+
     @postpone
     def identify_user_async(self, data: dict) -> None:
         self._identify_user(data)
 
+    def identify_users(self, users_feature_states: typing.Iterable[tuple]) -> None:
+        """
+        Identify multiple users with the integration.
+
+        :param users_feature_states: iterable of (user_id, feature_states) tuples
+        """
+        self._identify_users(
+            [
+                self.generate_user_data(user_id=user_id, feature_states=feature_states)
+                for user_id, feature_states in users_feature_states
+            ]
+        )
+
     @abstractstaticmethod
     def generate_user_data(*args, **kwargs) -> None:
         raise NotImplementedError
@@ -1,12 +1,43 @@
 import logging
+import typing
 
 import requests
+from django.db.models import Prefetch, prefetch_related_objects
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from features.models import FEATURE_STATE_VALUE_KEY_NAMES, FeatureStateValue
 from integrations.common.wrapper import AbstractBaseIdentityIntegrationWrapper
 
 logger = logging.getLogger(__name__)
 
 HEAP_API_URL = "https://heapanalytics.com"
+HEAP_REQUEST_TIMEOUT = (2, 5)  # (connect, read) in seconds
+HEAP_BULK_TRACK_BATCH_SIZE = 1000
+
+# the only fields of a feature state value needed to get its value
+FEATURE_STATE_VALUE_FIELDS = ("type", *FEATURE_STATE_VALUE_KEY_NAMES.values())
+
+# wrappers are instantiated for each identify request so the session is shared at
+# the module level to allow connections to heap to be kept alive and reused
+_session = requests.Session()
+_session.mount(
+    HEAP_API_URL,
+    HTTPAdapter(
+        pool_maxsize=50,
+        # track requests aren't idempotent so only retry when heap can't have
+        # received the event, i.e. not after a read timeout or a gateway timeout
+        max_retries=Retry(
+            total=2,
+            read=0,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503),
+            method_whitelist=frozenset(["POST"]),
+            # return the last response rather than raising once retries run out
+            raise_on_status=False,
+        ),
+    ),
+)
 
 
 class HeapWrapper(AbstractBaseIdentityIntegrationWrapper):
@@ -15,17 +46,46 @@ class HeapWrapper(AbstractBaseIdentityIntegrationWrapper):
         self.url = f"{HEAP_API_URL}/api/track"
 
     def _identify_user(self, user_data: dict) -> None:
-        response = requests.post(self.url, json=user_data)
+        try:
+            response = _session.post(
+                self.url, json=user_data, timeout=HEAP_REQUEST_TIMEOUT
+            )
+        except requests.RequestException as e:
+            logger.warning("Failed to send event to Heap: %s" % str(e))
+            return
         logger.debug("Sent event to Heap. Response code was: %s" % response.status_code)
 
-    def generate_user_data(self, user_id, feature_states):
-        feature_properties = {}
+    def _identify_users(self, users_data: typing.List[dict]) -> None:
+        # heap accepts multiple events in a single request to the track endpoint
+        for i in range(0, len(users_data), HEAP_BULK_TRACK_BATCH_SIZE):
+            events = [
+                {key: value for key, value in user_data.items() if key != "app_id"}
+                for user_data in users_data[i : i + HEAP_BULK_TRACK_BATCH_SIZE]
+            ]
+            # carry on with the remaining batches if one of them fails
+            try:
+                response = _session.post(
+                    self.url,
+                    json={"app_id": self.api_key, "events": events},
+                    timeout=HEAP_REQUEST_TIMEOUT,
+                )
+            except requests.RequestException as e:
+                logger.warning(
+                    "Failed to send %d events to Heap: %s" % (len(events), str(e))
+                )
+                continue
+            logger.debug(
+                "Sent %d events to Heap. Response code was: %s"
+                % (len(events), response.status_code)
+            )
 
-        for feature_state in feature_states:
-            value = feature_state.get_feature_state_value()
-            feature_properties[feature_state.feature.name] = (
-                value if (feature_state.enabled and value) else feature_state.enabled
+    def generate_user_data(self, user_id, feature_states):
+        feature_properties = {
+            feature_name: value if (enabled and value) else enabled
+            for feature_name, enabled, value in self._get_feature_state_data(
+                feature_states
             )
+        }
 
         return {
             "app_id": self.api_key,
@@ -33,3 +93,31 @@ class HeapWrapper(AbstractBaseIdentityIntegrationWrapper):
             "event": "Flagsmith Feature Flags",
             "properties": feature_properties,
         }
+
+    @staticmethod
+    def _get_feature_state_data(feature_states):
+        """
+        Get a (feature name, enabled, value) tuple for each of the given feature states
+        without querying the db once per feature state.
+        """
+        # load the related features and values in bulk up front. This is a no-op for
+        # any relations which have already been loaded using select_related.
+        feature_states = list(feature_states)
+        prefetch_related_objects(
+            feature_states,
+            "feature",
+            Prefetch(
+                "feature_state_value",
+                queryset=FeatureStateValue.objects.only(
+                    "feature_state", *FEATURE_STATE_VALUE_FIELDS
+                ),
+            ),
+        )
+        return [
+            (
+                feature_state.feature.name,
+                feature_state.enabled,
+                feature_state.get_feature_state_value(),
+            )
+            for feature_state in feature_states
+        ]
@@ -1,4 +1,9 @@
+import json
+from unittest import mock
+
 import pytest
+import requests
+import responses
 
 from environments.models import Environment
 from features.models import Feature, FeatureState
@@ -35,3 +40,126 @@ def test_heap_when_generate_user_data_with_correct_values_then_success():
         "properties": {"Test Feature": False},
     }
     assert expected_user_data == user_data
+
+
+@pytest.mark.django_db
+def test_heap_generate_user_data_does_not_query_per_feature_state(
+    django_assert_num_queries,
+):
+    # Given
+    heap_wrapper = HeapWrapper(api_key="123key")
+
+    organisation = Organisation.objects.create(name="Test Org")
+    project = Project.objects.create(name="Test Project", organisation=organisation)
+    environment = Environment.objects.create(name="Test Environment", project=project)
+    Feature.objects.create(name="Test Feature 0", project=project)
+    Feature.objects.create(name="Test Feature 1", project=project, initial_value=1)
+    Feature.objects.create(
+        name="Test Feature 2", project=project, default_enabled=True, initial_value=2
+    )
+    feature_states = FeatureState.objects.filter(environment=environment)
+
+    # When
+    # 1 query for the feature states, 1 for the features and 1 for the values
+    with django_assert_num_queries(3):
+        user_data = heap_wrapper.generate_user_data(
+            user_id="user123", feature_states=feature_states
+        )
+
+    # Then
+    assert user_data["properties"] == {
+        "Test Feature 0": False,
+        "Test Feature 1": False,
+        "Test Feature 2": 2,
+    }
+
+
+@responses.activate
+def test_heap_identify_user_posts_user_data_to_heap():
+    # Given
+    responses.add(responses.POST, f"{HEAP_API_URL}/api/track", status=200)
+    heap_wrapper = HeapWrapper(api_key="123key")
+    user_data = {"app_id": "123key", "identity": "user123"}
+
+    # When
+    heap_wrapper._identify_user(user_data)
+
+    # Then
+    assert len(responses.calls) == 1
+    assert json.loads(responses.calls[0].request.body) == user_data
+
+
+@mock.patch("integrations.heap.heap._session")
+def test_heap_identify_user_does_not_raise_if_request_fails(mock_session):
+    # Given
+    mock_session.post.side_effect = requests.exceptions.RetryError
+    heap_wrapper = HeapWrapper(api_key="123key")
+
+    # When
+    heap_wrapper._identify_user({"app_id": "123key", "identity": "user123"})
+
+    # Then
+    mock_session.post.assert_called_once()
+
+
+@responses.activate
+@pytest.mark.django_db
+def test_heap_identify_users_sends_all_users_in_a_single_request():
+    # Given
+    responses.add(responses.POST, f"{HEAP_API_URL}/api/track", status=200)
+    api_key = "123key"
+    heap_wrapper = HeapWrapper(api_key=api_key)
+
+    organisation = Organisation.objects.create(name="Test Org")
+    project = Project.objects.create(name="Test Project", organisation=organisation)
+    Environment.objects.create(name="Test Environment", project=project)
+    feature = Feature.objects.create(name="Test Feature", project=project)
+    feature_states = FeatureState.objects.filter(feature=feature)
+
+    # When
+    heap_wrapper.identify_users([("user1", feature_states), ("user2", feature_states)])
+
+    # Then
+    assert len(responses.calls) == 1
+    request_body = json.loads(responses.calls[0].request.body)
+    assert request_body["app_id"] == api_key
+    assert [event["identity"] for event in request_body["events"]] == [
+        "user1",
+        "user2",
+    ]
+
+
+@responses.activate
+@mock.patch("integrations.heap.heap.HEAP_BULK_TRACK_BATCH_SIZE", 1)
+def test_heap_identify_users_sends_a_request_per_batch():
+    # Given
+    responses.add(responses.POST, f"{HEAP_API_URL}/api/track", status=200)
+    heap_wrapper = HeapWrapper(api_key="123key")
+    users_data = [{"app_id": "123key", "identity": f"user{i}"} for i in range(3)]
+
+    # When
+    heap_wrapper._identify_users(users_data)
+
+    # Then
+    assert len(responses.calls) == 3
+    assert [json.loads(call.request.body)["events"] for call in responses.calls] == [
+        [{"identity": f"user{i}"}] for i in range(3)
+    ]
+
+
+@mock.patch("integrations.heap.heap.HEAP_BULK_TRACK_BATCH_SIZE", 1)
+@mock.patch("integrations.heap.heap._session")
+def test_heap_identify_users_sends_remaining_batches_if_a_request_fails(
+    mock_session,
+):
+    # Given
+    mock_session.post.side_effect = [requests.exceptions.ReadTimeout, mock.MagicMock()]
+    heap_wrapper = HeapWrapper(api_key="123key")
+    users_data = [{"app_id": "123key", "identity": f"user{i}"} for i in range(2)]
+
+    # When
+    heap_wrapper._identify_users(users_data)
+
+    # Then
+    assert mock_session.post.call_count == 2
+    assert mock_session.post.call_args[1]["json"]["events"] == [{"identity": "user1"}]